@@ -11,19 +11,24 @@ to only print content. To also test gist update, use:
     python codestats_box.py test <codestats-user> <stats-type> <gist-id> <github-token>
 """
 
-import datetime
+import hashlib
+import heapq
+import json
 import math
 import os
 import sys
-from collections import namedtuple
-from itertools import takewhile
-from typing import Any, Callable, Dict, List
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
 
 import requests
-from github import Github
-from github.InputFileContent import InputFileContent
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
-LabelAndValue = namedtuple("LabelAndValue", "title value")
+LabelAndValue = Tuple[str, str]
+# Name and content sha1 (if known) of the gist file
+GistMeta = Tuple[str, Optional[str]]
 
 # Type of stats
 STATS_TYPE_LEVEL = "level-xp"
@@ -36,11 +41,6 @@ ALLOWED_STATS_TYPES = [
 ]
 DEFAULT_STATS_TYPE = STATS_TYPE_LEVEL
 # Dicts for stats type dependent values
-VALUE_FORMAT = {
-    STATS_TYPE_LEVEL: "lvl {level:>3} ({xp:>9,} XP)",
-    STATS_TYPE_RECENT_XP: "lvl {level:>3} ({xp:>9,} XP) (+{recent_xp:>6,})",
-    STATS_TYPE_XP: "{xp:>9,} XP",
-}
 GIST_TITLE = {
     STATS_TYPE_LEVEL: "💻 My Code::Stats XP (Top Languages)",
     STATS_TYPE_RECENT_XP: "💻 My Code::Stats XP (Recent Languages)",
@@ -52,17 +52,21 @@ WIDTH_JUSTIFICATION_SEPARATOR = ":"
 RECENT_STATS_SEPARATOR = " + "
 TOTAL_XP_TITLE = "Total XP"
 NO_RECENT_XP_LINES = [
-    LabelAndValue("Not been coding recently", "🙈"),
-    LabelAndValue("Probably busy with something else", "🗓"),
-    LabelAndValue("Or just taking a break", "🌴"),
-    LabelAndValue("But would be back to it soon!", "🤓"),
+    ("Not been coding recently", "🙈"),
+    ("Probably busy with something else", "🗓"),
+    ("Or just taking a break", "🌴"),
+    ("But would be back to it soon!", "🤓"),
 ]
 # Internal constants
 MAX_LINE_LENGTH = 54
+# Sliced for every line instead of building a fresh separator string each time
+SEPARATOR_POOL = WIDTH_JUSTIFICATION_SEPARATOR * MAX_LINE_LENGTH
 ENV_VAR_GIST_ID = "GIST_ID"
 ENV_VAR_GITHUB_TOKEN = "GH_TOKEN"
 ENV_VAR_CODE_STATS_USERNAME = "CODE_STATS_USERNAME"
 ENV_VAR_STATS_TYPE = "STATS_TYPE"
+ENV_VAR_GITHUB_ACTIONS = "GITHUB_ACTIONS"
+ENV_VAR_RUNNER_DEBUG = "RUNNER_DEBUG"
 REQUIRED_ENVS = [
     ENV_VAR_GIST_ID,
     ENV_VAR_GITHUB_TOKEN,
@@ -76,117 +80,148 @@ CODE_STATS_TOTAL_NEW_XP_KEY = "new_xp"
 CODE_STATS_LANGUAGES_KEY = "languages"
 CODE_STATS_LANGUAGES_XP_KEY = "xps"
 CODE_STATS_LANGUAGES_NEW_XP_KEY = "new_xps"
-XP_TO_LEVEL = lambda xp: math.floor(0.025 * math.sqrt(xp))
-
-
-def validate_and_init() -> bool:
-    """Check environment variables present and valid."""
-    env_vars_absent = [
-        env
-        for env in REQUIRED_ENVS
-        if env not in os.environ or len(os.environ[env]) == 0
-    ]
+# GitHub API constants
+GITHUB_GIST_URL_FORMAT = "https://api.github.com/gists/{gist_id}"
+GITHUB_API_HEADERS = {
+    "Accept": "application/vnd.github+json",
+    "X-GitHub-Api-Version": "2022-11-28",
+}
+# Local cache constants
+CACHE_FILE_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), ".codestats_cache.json"
+)
+CACHE_URL_KEY = "url"
+CACHE_ETAG_KEY = "etag"
+CACHE_LAST_MODIFIED_KEY = "last_modified"
+CACHE_BODY_KEY = "body"
+CACHE_GIST_ID_KEY = "gist_id"
+CACHE_GIST_SHA1_KEY = "gist_sha1"
+CACHE_GIST_FILENAME_KEY = "gist_filename"
+CACHE_GIST_ETAG_KEY = "gist_etag"
+CACHE_RENDERED_FOR_KEY = "rendered_for"
+CACHE_RENDERED_FROM_KEY = "rendered_from"
+CACHE_RENDERED_TITLE_KEY = "rendered_title"
+CACHE_RENDERED_SHA1_KEY = "rendered_sha1"
+# HTTP constants
+REQUEST_TIMEOUT_SECONDS = 10
+MAX_RATE_LIMIT_WAIT_SECONDS = 60
+RETRY = Retry(
+    total=3,
+    backoff_factor=0.3,
+    status_forcelist=[429, 500, 502, 503, 504],
+    allowed_methods=frozenset(["GET", "PATCH"]),
+    # Keep retries on a short backoff, longer waits are capped in __send_request
+    respect_retry_after_header=False,
+    # Give back the last response, so callers handle it like any other
+    raise_on_status=False,
+)
+
+# One session per API, so the concurrent requests never share a session
+_CODE_STATS_SESSION = requests.Session()
+_CODE_STATS_SESSION.mount("https://", HTTPAdapter(max_retries=RETRY))
+_GITHUB_SESSION = requests.Session()
+_GITHUB_SESSION.mount("https://", HTTPAdapter(max_retries=RETRY))
+
+
+def validate_env() -> bool:
+    """Check required environment variables present."""
+    env_vars_absent = [env for env in REQUIRED_ENVS if not os.environ.get(env)]
     if env_vars_absent:
         print(f"Please define {env_vars_absent} in your github secrets. Aborting...")
         return False
 
-    if not (
-        ENV_VAR_STATS_TYPE in os.environ
-        and len(os.environ[ENV_VAR_STATS_TYPE]) > 0
-        and os.environ[ENV_VAR_STATS_TYPE] in ALLOWED_STATS_TYPES
-    ):
-        print(f"Using default stats type: {DEFAULT_STATS_TYPE}")
-        os.environ[ENV_VAR_STATS_TYPE] = DEFAULT_STATS_TYPE
-
     return True
 
 
-def get_code_stats_response(user: str) -> Dict[str, Any]:
-    """Get statistics from codestats for user."""
-    return requests.get(CODE_STATS_URL_FORMAT.format(user=user)).json()
+def __load_cache() -> Dict[str, Any]:
+    """Load local cache persisted by previous runs, empty if absent or broken."""
+    try:
+        with open(CACHE_FILE_PATH, encoding="utf-8") as cache_file:
+            return json.load(cache_file)
+    except (OSError, ValueError):
+        return {}
 
 
-def __get_formatted_value(
-    xp: int, recent_xp_supplier: Callable[[], int], stats_type: str
-) -> str:
-    """Get formatted value with xp and/or recent xp depending on stats type."""
-    value_format = VALUE_FORMAT[stats_type]
-    if stats_type == STATS_TYPE_LEVEL:
-        return value_format.format(level=XP_TO_LEVEL(xp), xp=xp)
-    elif stats_type == STATS_TYPE_RECENT_XP:
-        recent_xp = recent_xp_supplier()
-        formatted_value = value_format.format(
-            level=XP_TO_LEVEL(xp), xp=xp, recent_xp=recent_xp
-        )
-        return formatted_value if recent_xp > 0 else formatted_value[:-9]
-    elif stats_type == STATS_TYPE_XP:
-        return value_format.format(xp=xp)
-    raise RuntimeError(f"Unknown stats type {stats_type}")
-
+def __save_cache(cache: Dict[str, Any]):
+    """Persist local cache atomically, so an interrupted run can't corrupt it."""
+    temp_path = f"{CACHE_FILE_PATH}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as cache_file:
+        json.dump(cache, cache_file)
+    os.replace(temp_path, CACHE_FILE_PATH)
 
-def get_total_xp_line(
-    code_stats_response: Dict[str, Any], stats_type: str
-) -> LabelAndValue:
-    """Get label and formatted value for total xp.
 
-    Something along the lines of ("Total XP", "lvl  26 (1,104,152 XP)")
-    """
-    total_xp = code_stats_response[CODE_STATS_TOTAL_XP_KEY]
-    recent_total_xp_supplier = lambda: code_stats_response[CODE_STATS_TOTAL_NEW_XP_KEY]
-    formatted_value = __get_formatted_value(
-        total_xp, recent_total_xp_supplier, stats_type
-    )
-    return LabelAndValue(TOTAL_XP_TITLE, formatted_value)
+def __get_rate_limit_wait(response: requests.Response) -> float:
+    """Get seconds to wait before retrying a rate limited request, 0 if not limited."""
+    retry_after = response.headers.get("Retry-After", "")
+    if response.status_code == 429 and retry_after.isdigit():
+        return float(retry_after)
+    if (
+        response.status_code in (403, 429)
+        and response.headers.get("X-RateLimit-Remaining") == "0"
+    ):
+        return int(response.headers.get("X-RateLimit-Reset", 0)) - time.time()
+    return 0
 
 
-def __get_language_xp_line(
-    language: str, language_stats: Dict[str, int], stats_type: str
-) -> LabelAndValue:
-    """Get label and formatted value for language xp.
+def __send_request(
+    session: requests.Session,
+    method: str,
+    url: str,
+    headers: Dict[str, str],
+    **kwargs,
+) -> requests.Response:
+    """Send request with given session.
 
-    Something along the lines of ("Java", "lvl  19 (  580,523 XP)")
+    If rate limited and the limit resets soon enough, wait for it and retry once.
     """
-    xp = language_stats[CODE_STATS_LANGUAGES_XP_KEY]
-    recent_xp_supplier = lambda: language_stats[CODE_STATS_LANGUAGES_NEW_XP_KEY]
-    formatted_value = __get_formatted_value(xp, recent_xp_supplier, stats_type)
-    return LabelAndValue(language, formatted_value)
+    response = session.request(
+        method, url, headers=headers, timeout=REQUEST_TIMEOUT_SECONDS, **kwargs
+    )
+    wait = __get_rate_limit_wait(response)
+    if 0 < wait <= MAX_RATE_LIMIT_WAIT_SECONDS:
+        print(f"Rate limited, retrying in {wait:.0f} seconds...")
+        time.sleep(wait)
+        response = session.request(
+            method, url, headers=headers, timeout=REQUEST_TIMEOUT_SECONDS, **kwargs
+        )
+    return response
 
 
-def get_language_xp_lines(
-    code_stats_response: Dict[str, Any], stats_type: str
-) -> List[LabelAndValue]:
-    """Get list of labels and formatted values for languages.
+def get_code_stats_response(
+    user: str, cache: Dict[str, Any]
+) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """Get statistics from codestats for user, along with cache entries to update.
 
-    Decide which languages to include and return something like:
-    [
-        ("Java", "lvl  19 (  580,523 XP)"),
-        ("Python", "lvl   7 (   82,719 XP)"),
-    ]
+    Send validators from the previous response for the same user,
+    reuse cached body on 304. Cache itself is left untouched.
     """
-    if stats_type == STATS_TYPE_RECENT_XP:
-        # Only considering languages with recent xp
-        top_languages = list(
-            takewhile(
-                lambda t: t[1][CODE_STATS_LANGUAGES_NEW_XP_KEY] > 0,
-                sorted(
-                    code_stats_response[CODE_STATS_LANGUAGES_KEY].items(),
-                    key=lambda t: t[1][CODE_STATS_LANGUAGES_NEW_XP_KEY],
-                    reverse=True,
-                )[:TOP_LANGUAGES_COUNT],
-            ),
-        )
-        if not top_languages:
-            return NO_RECENT_XP_LINES
-    else:
-        top_languages = sorted(
-            code_stats_response[CODE_STATS_LANGUAGES_KEY].items(),
-            key=lambda t: t[1][CODE_STATS_LANGUAGES_XP_KEY],
-            reverse=True,
-        )[:TOP_LANGUAGES_COUNT]
-    return [
-        __get_language_xp_line(language, stats, stats_type)
-        for language, stats in top_languages
-    ]
+    url = CODE_STATS_URL_FORMAT.format(user=user)
+    # Cached response may belong to another user, e.g. after a test run
+    is_cached = cache.get(CACHE_URL_KEY) == url and CACHE_BODY_KEY in cache
+    headers = {}
+    if is_cached and cache.get(CACHE_ETAG_KEY):
+        headers["If-None-Match"] = cache[CACHE_ETAG_KEY]
+    if is_cached and cache.get(CACHE_LAST_MODIFIED_KEY):
+        headers["If-Modified-Since"] = cache[CACHE_LAST_MODIFIED_KEY]
+    response = __send_request(_CODE_STATS_SESSION, "GET", url, headers)
+    if response.status_code == 304 and is_cached:
+        return json.loads(cache[CACHE_BODY_KEY]), {}
+
+    response.raise_for_status()
+    cache_updates = {
+        CACHE_URL_KEY: url,
+        CACHE_ETAG_KEY: response.headers.get("ETag"),
+        CACHE_LAST_MODIFIED_KEY: response.headers.get("Last-Modified"),
+        # JSON is always UTF-8, no need for requests to guess the encoding
+        CACHE_BODY_KEY: response.content.decode("utf-8"),
+    }
+    return json.loads(response.content), cache_updates
+
+
+@lru_cache(maxsize=64)
+def __xp_to_level(xp: int) -> int:
+    """Get Code::Stats level for given xp."""
+    return int(0.025 * math.sqrt(xp))
 
 
 def get_adjusted_line(title_and_value: LabelAndValue) -> str:
@@ -194,63 +229,279 @@ def get_adjusted_line(title_and_value: LabelAndValue) -> str:
 
     Something like (label, value) -> "label ::::::::::::: value"
     """
-    separation = MAX_LINE_LENGTH - (
-        len(title_and_value.title) + len(title_and_value.value) + 2
-    )
-    separator = f" {WIDTH_JUSTIFICATION_SEPARATOR * separation} "
-    return title_and_value.title + separator + title_and_value.value
+    title, value = title_and_value
+    separation = MAX_LINE_LENGTH - (len(title) + len(value) + 2)
+    separator = f" {SEPARATOR_POOL[:max(separation, 0)]} "
+    return title + separator + value
 
 
-def update_gist(title: str, content: str) -> bool:
-    """Update gist with provided title and content.
+def __get_github_headers(access_token: str) -> Dict[str, str]:
+    """Get headers for GitHub API requests authenticated with given token."""
+    return {**GITHUB_API_HEADERS, "Authorization": f"Bearer {access_token}"}
+
+
+def fetch_gist_meta(
+    gist_id: str, access_token: str, cache: Dict[str, Any]
+) -> Tuple[GistMeta, Dict[str, Any]]:
+    """Get name and content sha1 of the first file in the gist...
 
-    Use gist id and github token present in environment variables.
-    Replace first file in the gist.
+    ...along with cache entries to update. Send ETag from the previous response
+    for the same gist, reuse cached values on 304. Cache itself is left untouched.
     """
-    access_token = os.environ[ENV_VAR_GITHUB_TOKEN]
-    gist_id = os.environ[ENV_VAR_GIST_ID]
-    gist = Github(access_token).get_gist(gist_id)
+    is_cached = (
+        cache.get(CACHE_GIST_ID_KEY) == gist_id and CACHE_GIST_FILENAME_KEY in cache
+    )
+    headers = __get_github_headers(access_token)
+    if is_cached and cache.get(CACHE_GIST_ETAG_KEY):
+        headers["If-None-Match"] = cache[CACHE_GIST_ETAG_KEY]
+    response = __send_request(
+        _GITHUB_SESSION, "GET", GITHUB_GIST_URL_FORMAT.format(gist_id=gist_id), headers
+    )
+    if response.status_code == 304 and is_cached:
+        return (cache[CACHE_GIST_FILENAME_KEY], cache.get(CACHE_GIST_SHA1_KEY)), {}
+
+    response.raise_for_status()
     # Works only for single file. Should we clear all files and create new file?
-    old_title = list(gist.files.keys())[0]
-    gist.edit(title, {old_title: InputFileContent(content, title)})
-    print(f"{title}\n{content}")
+    gist_file = next(iter(json.loads(response.content)["files"].values()))
+    gist_meta = (
+        gist_file["filename"],
+        hashlib.sha1(gist_file["content"].encode()).hexdigest(),
+    )
+    cache_updates = {
+        CACHE_GIST_ID_KEY: gist_id,
+        CACHE_GIST_ETAG_KEY: response.headers.get("ETag"),
+        CACHE_GIST_FILENAME_KEY: gist_meta[0],
+        CACHE_GIST_SHA1_KEY: gist_meta[1],
+    }
+    return gist_meta, cache_updates
+
+
+def update_gist(
+    gist_id: str,
+    access_token: str,
+    title: str,
+    content: str,
+    gist_meta: GistMeta,
+    cache: Dict[str, Any],
+    echo: bool,
+) -> None:
+    """Update gist with provided title and content.
 
+    Replace first file in the gist, as described by gist_meta from
+    fetch_gist_meta, with a single PATCH request.
+    Skip the update if the gist already has the same title and content.
+    Write the new title and content to stdout if echo is set.
+    """
+    old_title, old_content_sha1 = gist_meta
+    content_sha1 = hashlib.sha1(content.encode()).hexdigest()
+    if old_title == title and old_content_sha1 == content_sha1:
+        print("Gist content is already up-to-date. Skipping update.")
+        return
+
+    response = __send_request(
+        _GITHUB_SESSION,
+        "PATCH",
+        GITHUB_GIST_URL_FORMAT.format(gist_id=gist_id),
+        __get_github_headers(access_token),
+        json={
+            "description": title,
+            "files": {old_title: {"filename": title, "content": content}},
+        },
+    )
+    response.raise_for_status()
+    cache[CACHE_GIST_ID_KEY] = gist_id
+    cache[CACHE_GIST_ETAG_KEY] = response.headers.get("ETag")
+    cache[CACHE_GIST_FILENAME_KEY] = title
+    cache[CACHE_GIST_SHA1_KEY] = content_sha1
+    if echo:
+        sys.stdout.write(f"{title}\n{content}\n")
 
-def get_stats() -> str:
-    """Get stats for codestats user according to stats type...
 
-    ...both extracted from environment variables.
+def __format_xp(xp: int, width: int = 9) -> str:
+    """Format xp with thousands separators, right aligned to given width.
+
+    Something like 580523 -> "  580,523"
     """
-    code_stats_user_name = os.environ[ENV_VAR_CODE_STATS_USERNAME]
-    code_stats_response = get_code_stats_response(code_stats_user_name)
+    return format(xp, ",d").rjust(width)
+
+
+def __get_top_languages(
+    languages: Dict[str, Dict[str, int]], xp_key: str
+) -> List[Tuple[str, Dict[str, int]]]:
+    """Get top languages along with their stats, sorted by given xp key."""
+    return heapq.nlargest(
+        TOP_LANGUAGES_COUNT, languages.items(), key=lambda t: t[1][xp_key]
+    )
+
+
+def __render_level(code_stats_response: Dict[str, Any]) -> str:
+    """Render total and top languages xp with level, sorted by xp.
+
+    Something along the lines of "Java :::::: lvl  19 (  580,523 XP)"
+    """
+    top_languages = __get_top_languages(
+        code_stats_response[CODE_STATS_LANGUAGES_KEY], CODE_STATS_LANGUAGES_XP_KEY
+    )
+    return "\n".join(
+        get_adjusted_line((title, f"lvl {__xp_to_level(xp):>3} ({__format_xp(xp)} XP)"))
+        for title, xp in [
+            (TOTAL_XP_TITLE, code_stats_response[CODE_STATS_TOTAL_XP_KEY]),
+            *(
+                (language, stats[CODE_STATS_LANGUAGES_XP_KEY])
+                for language, stats in top_languages
+            ),
+        ]
+    )
 
-    stats_type = os.environ[ENV_VAR_STATS_TYPE]
-    total_xp_line = get_total_xp_line(code_stats_response, stats_type)
-    language_xp_lines = get_language_xp_lines(code_stats_response, stats_type)
 
+def __render_recent_xp(code_stats_response: Dict[str, Any]) -> str:
+    """Render total and recent languages xp with level and recent xp...
+
+    ...sorted by recent xp, something along the lines of
+    "Python ::::: lvl   7 (   82,719 XP) (+1,789)"
+    """
+    # Only considering languages with recent xp
+    recent_languages = {
+        language: stats
+        for language, stats in code_stats_response[CODE_STATS_LANGUAGES_KEY].items()
+        if stats[CODE_STATS_LANGUAGES_NEW_XP_KEY] > 0
+    }
+    top_languages = __get_top_languages(
+        recent_languages, CODE_STATS_LANGUAGES_NEW_XP_KEY
+    )
     lines = [
-        get_adjusted_line(title_and_value)
-        for title_and_value in [total_xp_line, *language_xp_lines]
+        get_adjusted_line(
+            (
+                title,
+                f"lvl {__xp_to_level(xp):>3} ({__format_xp(xp)} XP) "
+                + (f"(+{__format_xp(recent_xp, 6)})" if recent_xp > 0 else ""),
+            )
+        )
+        for title, xp, recent_xp in [
+            (
+                TOTAL_XP_TITLE,
+                code_stats_response[CODE_STATS_TOTAL_XP_KEY],
+                code_stats_response[CODE_STATS_TOTAL_NEW_XP_KEY],
+            ),
+            *(
+                (
+                    language,
+                    stats[CODE_STATS_LANGUAGES_XP_KEY],
+                    stats[CODE_STATS_LANGUAGES_NEW_XP_KEY],
+                )
+                for language, stats in top_languages
+            ),
+        ]
     ]
+    if not top_languages:
+        lines.extend(map(get_adjusted_line, NO_RECENT_XP_LINES))
     return "\n".join(lines)
 
 
+def __render_xp(code_stats_response: Dict[str, Any]) -> str:
+    """Render total and top languages xp, sorted by xp.
+
+    Something along the lines of "Java :::::::::::   580,523 XP"
+    """
+    top_languages = __get_top_languages(
+        code_stats_response[CODE_STATS_LANGUAGES_KEY], CODE_STATS_LANGUAGES_XP_KEY
+    )
+    return "\n".join(
+        get_adjusted_line((title, f"{__format_xp(xp)} XP"))
+        for title, xp in [
+            (TOTAL_XP_TITLE, code_stats_response[CODE_STATS_TOTAL_XP_KEY]),
+            *(
+                (language, stats[CODE_STATS_LANGUAGES_XP_KEY])
+                for language, stats in top_languages
+            ),
+        ]
+    )
+
+
+# Renderers specialized for each stats type, so rendering doesn't branch on it
+RENDERERS = {
+    STATS_TYPE_LEVEL: __render_level,
+    STATS_TYPE_RECENT_XP: __render_recent_xp,
+    STATS_TYPE_XP: __render_xp,
+}
+
+
+def get_stats(code_stats_response: Dict[str, Any], stats_type: str) -> str:
+    """Get stats from codestats response according to stats type."""
+    return RENDERERS[stats_type](code_stats_response)
+
+
 def main():
     """Validate prerequisites, get content and update gist."""
-    if not validate_and_init():
+    if not validate_env():
         raise RuntimeError(
             "Validations failed! See the messages above for more information"
         )
 
-    stats_type = os.environ[ENV_VAR_STATS_TYPE]
+    # Read environment once, everything below gets values passed explicitly
+    code_stats_user_name = os.environ[ENV_VAR_CODE_STATS_USERNAME]
+    stats_type = os.environ.get(ENV_VAR_STATS_TYPE)
+    if stats_type not in ALLOWED_STATS_TYPES:
+        print(f"Using default stats type: {DEFAULT_STATS_TYPE}")
+        stats_type = DEFAULT_STATS_TYPE
+    gist_id = os.environ[ENV_VAR_GIST_ID]
+    access_token = os.environ[ENV_VAR_GITHUB_TOKEN]
+    # Only echo the content on actions runs when debug logging is enabled
+    echo = (
+        os.environ.get(ENV_VAR_GITHUB_ACTIONS) != "true"
+        or os.environ.get(ENV_VAR_RUNNER_DEBUG) == "1"
+    )
     title = GIST_TITLE[stats_type]
-    content = get_stats()
-    update_gist(title, content)
+    rendered_for = f"{code_stats_user_name}:{stats_type}"
+    cache = __load_cache()
+    # Both requests are independent, so run them concurrently
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        code_stats_future = executor.submit(
+            get_code_stats_response, code_stats_user_name, cache
+        )
+        gist_meta_future = executor.submit(
+            fetch_gist_meta, gist_id, access_token, cache
+        )
+        code_stats_response, code_stats_cache_updates = code_stats_future.result()
+        gist_meta, gist_cache_updates = gist_meta_future.result()
+    # Workers only read the cache, all updates happen here after both are done
+    cache.update(code_stats_cache_updates)
+    cache.update(gist_cache_updates)
+
+    # Same validators as when last rendered mean the stats have not changed
+    code_stats_validators = [
+        cache.get(CACHE_ETAG_KEY),
+        cache.get(CACHE_LAST_MODIFIED_KEY),
+    ]
+    if (
+        any(code_stats_validators)
+        and cache.get(CACHE_RENDERED_FROM_KEY) == code_stats_validators
+        and cache.get(CACHE_RENDERED_FOR_KEY) == rendered_for
+        and gist_meta
+        == (cache.get(CACHE_RENDERED_TITLE_KEY), cache.get(CACHE_RENDERED_SHA1_KEY))
+    ):
+        print("No changes in Code::Stats since last run. Skipping update.")
+        __save_cache(cache)
+        return
+
+    content = get_stats(code_stats_response, stats_type)
+    update_gist(
+        gist_id,
+        access_token,
+        title,
+        content,
+        gist_meta,
+        cache,
+        echo,
+    )
+    cache[CACHE_RENDERED_FOR_KEY] = rendered_for
+    cache[CACHE_RENDERED_FROM_KEY] = code_stats_validators
+    cache[CACHE_RENDERED_TITLE_KEY] = title
+    cache[CACHE_RENDERED_SHA1_KEY] = hashlib.sha1(content.encode()).hexdigest()
+    __save_cache(cache)
 
 
 if __name__ == "__main__":
-    import time
-
     s = time.perf_counter()
     if len(sys.argv) > 1:
         # Test run
@@ -263,7 +514,13 @@ if __name__ == "__main__":
             main()
         else:
             # Testing stats content only
-            print(get_stats())
+            cache = __load_cache()
+            code_stats_response, cache_updates = get_code_stats_response(
+                sys.argv[2], cache
+            )
+            print(get_stats(code_stats_response, sys.argv[3]))
+            cache.update(cache_updates)
+            __save_cache(cache)
     else:
         # Normal run
         main()